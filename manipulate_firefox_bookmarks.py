@@ -13,6 +13,9 @@
     There is also a method to return all the bookmarks (as Node objects) as a
     list.
 
+    The module can be imported without side effects; build_tree() converts
+    loaded JSON into a GeneralTree. The command line is handled by main().
+
     This is all accomplished using two main objects.
 
     A GeneralTree object represents the tree and holds most of the useful
@@ -24,215 +27,177 @@
 
 import json
 import argparse
+import os
 import sys
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:  # orjson is optional but decodes large bookmark files much faster
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads  # type: ignore[assignment]
 
 # Section 1: Parse Arguments with `argparse`
 
-parser = argparse.ArgumentParser("Manipualtes Firefox bookmarks JSON in various ways. Default "
-                                 + "behaviour is to output a list of bookmark/folder titles with "
-                                 + "no special formatting.")
+def make_parser() -> argparse.ArgumentParser:
+    ''' Return the ArgumentParser for the command-line interface. '''
 
-parser.add_argument("FILE", help="The bookmarks file to parse.")
+    parser = argparse.ArgumentParser(description="Manipualtes Firefox bookmarks JSON in various "
+                                     + "ways. Default behaviour is to output a list of bookmark/folder"
+                                     + " titles with no special formatting.")
 
-parser.add_argument("--to_markdown",
-                    help="Convert the bookmarks file to markdown. The value is the initial"
-                    + " header level. Outputs to stdout.",
-                    metavar="1-6",
-                    required=False,
-                    choices=range(1, 6),
-                    type=int)
+    parser.add_argument("FILE", help="The bookmarks file to parse.")
 
-parser.add_argument("--pretty_text",
-                    help="Output the bookmarks file as plain text with spaces or tabs to show"
-                    + " children. Outputs to stdout.",
-                    metavar="{spaces|tabs}",
-                    required=False,
-                    choices=["spaces", "tabs"])
+    parser.add_argument("--to_markdown",
+                        help="Convert the bookmarks file to markdown. The value is the initial"
+                        + " header level. Outputs to stdout.",
+                        metavar="1-6",
+                        required=False,
+                        choices=range(1, 6),
+                        type=int)
 
-args = parser.parse_args()
+    parser.add_argument("--pretty_text",
+                        help="Output the bookmarks file as plain text with spaces or tabs to show"
+                        + " children. Outputs to stdout.",
+                        metavar="{spaces|tabs}",
+                        required=False,
+                        choices=["spaces", "tabs"])
+
+    return parser
 
 # Section 2: ADTs
 
 class Node:
     '''
     A node of a GeneralTree. Each node represents a bookmark or bookmark
-    container.
+    container. Attributes are accessed directly; is_folder and title_escaped
+    (title with vertical bars escaped for markdown) are set once when the
+    node is built.
     '''
 
-    def __init__(self):
-        self.guid = None
-        self.title = None
-        self.index = None
-        self.date_added = None
-        self.last_modified = None
-        self.identity = None
-        self.type_ = None
-        self.type_code = None
-        self.root = None
-        self.uri = None
-        self.guid_of_parent = None
-
-    def set_guid(self, guid):
-        self.guid = guid
-
-    def get_guid(self):
-        return self.guid
-
-    def set_title(self, title):
-        self.title = title
-
-    def get_title(self):
-        return self.title
-
-    def set_index(self, index):
-        self.index = index
-
-    def get_index(self):
-        return self.index
-
-    def set_date_added(self, date_added):
-        self.date_added = date_added
-
-    def get_date_added(self):
-        return self.date_added
-
-    def set_last_modified(self, last_modified):
-        self.last_modified = last_modified
-
-    def get_last_modified(self):
-        return self.last_modified
-
-    def set_id(self, identity):
-        self.identity = identity
-
-    def get_id(self):
-        return self.identity
-
-    def set_type_code(self, type_code):
-        self.type_code = type_code
-
-    def get_type_code(self):
-        return self.type_code
-
-    def set_type(self, type_):
-        self.type_ = type_
-
-    def get_type(self):
-        return self.type_
-
-    def set_root(self, root):
-        self.root = root
-
-    def get_root(self):
-        return self.root
-
-    def set_uri(self, uri):
-        self.uri = uri
-
-    def get_uri(self):
-        return self.uri
-
-    def is_folder(self):
-        return self.type_ == "text/x-moz-place-container"
-
-    def set_parent_guid(self, guid):
-        self.guid_of_parent = guid
-
-    def get_parent_guid(self):
-        return self.guid_of_parent
+    __slots__ = ("guid", "title", "index", "date_added", "last_modified",
+                 "identity", "type_", "type_code", "root", "uri",
+                 "guid_of_parent", "is_folder", "title_escaped")
+
+    def __init__(self) -> None:
+        # Values copied from the JSON are typed Any as the JSON is untyped.
+        self.guid: Any = None
+        self.title: Any = None
+        self.index: Any = None
+        self.date_added: Any = None
+        self.last_modified: Any = None
+        self.identity: Any = None
+        self.type_: Any = None
+        self.type_code: Any = None
+        self.root: Any = None
+        self.uri: Any = None
+        self.guid_of_parent: Any = None
+        self.is_folder: bool = False
+        self.title_escaped: Any = None
 
 
 class GeneralTree:
     '''
-        Takes Firefox JSON bookmarks data and converts it into a general tree
-        data structure. The structure is created in init using recursion.
-        GeneralTree holds a reference (self.node) to the current node (Node
-        object) and list of child GeneralTrees (self.children). All actual
-        data is held with Node objects.
+        A general tree data structure built from Firefox JSON bookmarks data
+        (see build_tree). GeneralTree holds a reference (self.node) to the
+        current node (Node object) and list of child GeneralTrees
+        (self.children). The same children are also split, in order, into
+        self.folder_children and self.link_children. All actual data is
+        held with Node objects.
+
+        A tree created with has_children=False (e.g. a bookmark link) shares
+        an empty tuple for all three instead of allocating lists.
     '''
 
-    def __init__(self, exportedJSON, parentGUID):
-        '''
-            exportedJSON = the bookmarks JSON exported from Firefox.
-            parentGUID = the GUID of the parent. Should be None for the
-                initial call.
-        '''
+    __slots__ = ("node", "children", "folder_children", "link_children")
 
+    def __init__(self, has_children: bool = True) -> None:
         self.node = Node()
-        self.children = []
-        child_value = ""  # Temporary to hold any children we find
-        if parentGUID is not None:  # Assuming None implies the root node
-            self.node.set_parent_guid(parentGUID)
-        for key, value in exportedJSON.items():
-            if key == "guid":
-                self.node.set_guid(value)
-            if key == "title":
-                self.node.set_title(value)
-            if key == "index":
-                self.node.set_index(value)
-            if key == "dateAdded":
-                self.node.set_date_added(value)
-            if key == "lastModified":
-                self.node.set_last_modified(value)
-            if key == "typeCode":
-                self.node.set_type_code(value)
-            if key == "type":
-                self.node.set_type(value)
-            if key == "root":
-                self.node.set_root(value)
-            if key == "uri":
-                self.node.set_uri(value)
-            if key == "id":
-                self.node.set_id(value)
-            if key == "children":
-                child_value = value
-        for item in child_value:
-            self.children.append(GeneralTree(item, self.node.get_guid()))
-
-    def has_children(self):
-        return len(self.children) > 0
-
-    def print_all_titles(self):
+        self.children: Sequence[GeneralTree]
+        self.folder_children: Sequence[GeneralTree]
+        self.link_children: Sequence[GeneralTree]
+        if has_children:
+            self.children = []
+            self.folder_children = []
+            self.link_children = []
+        else:
+            self.children = self.folder_children = self.link_children = ()
+
+    def print_all_titles(self, out: Optional[List[str]] = None) -> None:
         '''
             Print the titles of all bookmarks and containers. Includes
             containers usually abstracted away from a Firefox user,
             e.g. root.
+                out = list to append output to. If None, the output is
+                      collected and written with write_output.
+        '''
+
+        if out is None:
+            out = []
+            self.print_all_titles(out)
+            write_output(out)
+            return
+        append = out.append
+        for node in self.iter_nodes():
+            append(f"{node.title}\n")  # Like print, a missing title is "None"
+
+    def iter_nodes(self) -> Iterator[Node]:
+        '''
+            Yield every Node in the tree, parents before their children.
         '''
 
-        print(self.node.get_title())
-        for child in self.children:
-            child.print_all_titles()
+        stack: List[GeneralTree] = [self]
+        pop = stack.pop
+        extend = stack.extend
+        while stack:
+            tree = pop()
+            yield tree.node
+            extend(reversed(tree.children))
 
-    def return_all_nodes(self):
+    def return_all_nodes(self) -> List[Node]:
         '''
-            Return a list of Nodes in the tree as list.
+            Return a flat list of all Nodes in the tree.
         '''
 
-        nodes = []
-        nodes.append(self.node)
-        for child in self.children:
-            nodes.append(child.return_all_nodes())
-        return nodes
+        return list(self.iter_nodes())
 
-    def print_all_titles_spacer(self, initial_spacer, spacer):
+    def print_all_titles_spacer(self, initial_spacer: str, spacer: str,
+                                out: Optional[List[str]] = None) -> None:
         '''
             Outputs titles with an additional spacer for the contents of each subfolder.
                 initial_spacer  = starting whitespace
                 spacer          = whitespace to add for children of each subfolder
+                out             = list to append output to. If None, the output is
+                                  collected and written with write_output.
         '''
 
-        if self.node.get_title() == "":  # Assuming the only empty title is root
-            print("root")
-        else:
-            print(initial_spacer + self.node.get_title())
-        if self.has_children():
-            for child in self.children:
-                child.print_all_titles_spacer(initial_spacer + spacer, spacer)
-        else:
-            for child in self.children:
-                child.print_all_titles_spacer(initial_spacer, spacer)
-
-    def to_markdown(self, header):
+        if out is None:
+            out = []
+            self.print_all_titles_spacer(initial_spacer, spacer, out)
+            write_output(out)
+            return
+        # prefixes[depth] is the whitespace for a node at that depth. Each is
+        # built once, when the traversal first reaches that depth.
+        prefixes = [initial_spacer]
+        append = out.append
+        stack: List[Tuple[GeneralTree, int]] = [(self, 0)]
+        pop = stack.pop
+        extend = stack.extend
+        while stack:
+            tree, depth = pop()
+            title = tree.node.title
+            if title == "":  # Assuming the only empty title is root
+                append("root\n")
+            else:
+                append(prefixes[depth] + title + "\n")
+            children = tree.children
+            if children:
+                depth += 1
+                if depth == len(prefixes):
+                    prefixes.append(prefixes[-1] + spacer)
+                extend((child, depth) for child in reversed(children))
+
+    def to_markdown(self, header: int, out: Optional[List[str]] = None) -> None:
         '''
             Converts the tree structure into markdown and outputs it to stdout.
 
@@ -245,66 +210,224 @@ class GeneralTree:
             of parent folders can visually appear under that of subfolders.
 
             header is an int representing the level of header to start with.
+            out is a list to append output to. If None, the output is
+            collected and written with write_output.
         '''
 
-        folders = []
-        if self.node.is_folder():
-            print('')
-            for i in range(header):
-                print('#', end='')
-            print(' ', end='')
-            if self.node.get_title() == "":
-                print("root")
+        if out is None:
+            out = []
+            self.to_markdown(header, out)
+            write_output(out)
+            return
+        headers = _HEADERS
+        max_header = len(headers)
+        append = out.append
+        stack: List[Tuple[GeneralTree, int]] = [(self, header)]
+        pop = stack.pop
+        extend = stack.extend
+        while stack:
+            tree, header = pop()
+            node = tree.node
+            if node.is_folder:
+                if node.title == "":
+                    title = "root"
+                else:
+                    title = node.title_escaped
+                if header < max_header:
+                    append(headers[header] + title + "\n\n")
+                else:  # Nested deeper than markdown's six header levels
+                    append("\n" + "#" * header + " " + title + "\n\n")
+                header += 1
+                # Last pushed is popped first, so links come before folders.
+                extend((child, header) for child in reversed(tree.folder_children))
+                extend((child, header) for child in reversed(tree.link_children))
             else:
-                print(escape_vertical_bars(self.node.get_title()))
-            print('')
-            header += 1
-            if len(self.children) > 0:
-                for child in self.children:
-                    if child.node.is_folder():
-                        folders.append(child)
-                    else:
-                        child.to_markdown(header)
-                for child in folders:
-                    child.to_markdown(header)
-        else:
-            print('- [' + escape_vertical_bars(self.node.get_title())
-                  + '](' + self.node.get_uri() + ')')
+                append('- [' + node.title_escaped + '](' + node.uri + ')\n')
 
 # Section 3: Helper Functions
 
-def escape_vertical_bars(input_string):
+# Type of a Firefox bookmarks JSON object that is a container (folder).
+FOLDER_TYPE = "text/x-moz-place-container"
+
+# Maps each key of a Firefox bookmarks JSON object to the Node attribute that
+# stores it. "children" is absent as it is handled by build_tree.
+_KEY_ATTRIBUTES = {
+    "guid": "guid",
+    "title": "title",
+    "index": "index",
+    "dateAdded": "date_added",
+    "lastModified": "last_modified",
+    "typeCode": "type_code",
+    "type": "type_",
+    "root": "root",
+    "uri": "uri",
+    "id": "identity",
+}
+
+# Start of a markdown header line for each level, indexed by level (1-6).
+_HEADERS = ["\n" + "#" * level + " " for level in range(7)]
+
+# JSON keys needed by each output. Passed to build_tree as fields so that
+# Nodes only hold what will be printed ("type" is always needed to tell
+# folders from links).
+TEXT_FIELDS = ("title", "type")
+MARKDOWN_FIELDS = ("title", "uri", "type")
+
+def _make_node(exportedJSON: Dict[str, Any], parentGUID: Optional[str],
+               key_attributes: Dict[str, str] = _KEY_ATTRIBUTES,
+               escape_title: bool = True) -> GeneralTree:
+    '''
+        Return a GeneralTree with its Node populated from a single JSON
+        object. Children are not processed and are left as empty tuples;
+        see build_tree.
+            exportedJSON = a bookmark or container object from the JSON.
+            parentGUID = the GUID of the parent. None for the root node.
+            key_attributes = the subset of _KEY_ATTRIBUTES to populate.
+            escape_title = whether to set title_escaped, which only
+                           to_markdown reads.
+    '''
+
+    tree = GeneralTree(has_children=False)
+    node = tree.node
+    if parentGUID is not None:  # Assuming None implies the root node
+        node.guid_of_parent = parentGUID
+    for key, attribute in key_attributes.items():
+        value = exportedJSON.get(key)
+        if value is not None:
+            setattr(node, attribute, value)
+    node.is_folder = node.type_ == FOLDER_TYPE
+    if escape_title and node.title is not None:
+        node.title_escaped = escape_vertical_bars(node.title)
+    return tree
+
+def build_tree(exportedJSON: Dict[str, Any],
+               fields: Optional[Iterable[str]] = None,
+               escape_titles: bool = True,
+               consume: bool = False) -> GeneralTree:
+    '''
+        Convert the bookmarks JSON exported from Firefox into a GeneralTree
+        and return the root. Uses an explicit stack rather than recursion so
+        deeply nested bookmarks cannot hit the recursion limit.
+
+        fields is an iterable of JSON keys (e.g. TEXT_FIELDS) to store on
+        each Node. Other Node attributes are left as None. If None, every key
+        in _KEY_ATTRIBUTES is stored. A ValueError is raised for any other
+        key.
+
+        escape_titles sets Node.title_escaped, which only to_markdown reads.
+        A tree built with escape_titles=False, or without "title" and "uri"
+        among its fields (e.g. TEXT_FIELDS), cannot be output as markdown.
+
+        If consume is True, exportedJSON is emptied as it is read: each
+        object's "children" is removed once it has been queued, so the JSON
+        is freed as the tree is built rather than both being held in memory
+        in full. Otherwise exportedJSON is left unchanged.
+    '''
+
+    if fields is None:
+        key_attributes = _KEY_ATTRIBUTES
+    else:
+        fields = tuple(fields)
+        unknown = [key for key in fields if key not in _KEY_ATTRIBUTES]
+        if unknown:
+            raise ValueError("Unknown bookmark field(s): " + ", ".join(unknown))
+        key_attributes = {key: _KEY_ATTRIBUTES[key] for key in fields}
+    get_children = dict.pop if consume else dict.get
+    # Each item carries its parent's GUID and the parent's three child lists
+    # (children, folder_children, link_children) to append to. The root is
+    # appended to a list of its own.
+    roots: List[GeneralTree] = []
+    stack: Deque[Tuple[Dict[str, Any], Optional[str], List[GeneralTree],
+                       List[GeneralTree], List[GeneralTree]]] = deque(
+        [(exportedJSON, None, roots, [], [])])
+    while stack:
+        item, parent_guid, siblings, folders, links = stack.popleft()
+        children = get_children(item, "children", None)
+        tree = _make_node(item, parent_guid, key_attributes, escape_titles)
+        siblings.append(tree)
+        if tree.node.is_folder:
+            folders.append(tree)
+        else:
+            links.append(tree)
+        if children:
+            tree_children: List[GeneralTree] = []
+            tree_folders: List[GeneralTree] = []
+            tree_links: List[GeneralTree] = []
+            tree.children = tree_children
+            tree.folder_children = tree_folders
+            tree.link_children = tree_links
+            guid = tree.node.guid
+            stack.extendleft(reversed([(child, guid, tree_children, tree_folders, tree_links)
+                                       for child in children]))
+    return roots[0]
+
+def write_output(out: List[str]) -> None:
+    '''
+        Write a list of output strings to stdout in a single call. The text is
+        encoded once and written to the underlying binary buffer, skipping
+        the per-write work of the text layer.
+    '''
+
+    text = "".join(out)
+    stream = sys.stdout
+    buffer = getattr(stream, "buffer", None)
+    if buffer is None:  # e.g. stdout replaced by an io.StringIO
+        stream.write(text)
+        return
+    if os.linesep != "\n":  # Match text mode newline translation
+        text = text.replace("\n", os.linesep)
+    stream.flush()
+    buffer.write(text.encode(stream.encoding, stream.errors or "strict"))
+    buffer.flush()
+
+def escape_vertical_bars(input_string: str) -> str:
     ''' Escape vertical bars to stop markdown parsers confusing them with tables. '''
     return input_string.replace("|", "\\|")
 
 # Section 4: Initialisation and Validation
 
-# The args object is the end result of processing arguments in Section 1.
-# An attribute on args is created for each command-line argument:
-#   to_markdown, pretty_text, and FILE
-# If an argument is not set, the value is None.
-
-try:
-    with open(args.FILE) as f:
-        data = json.load(f)
-except FileNotFoundError:
-    print("The specified file does not exist.")
-    sys.exit(1)
-except PermissionError:
-    print("The program does not have permission to read the specified file.")
-    sys.exit(1)
-
-bookmarks = GeneralTree(data, None)
-
-if args.pretty_text is not None and args.to_markdown is not None:
-    print("Please choose --pretty_text or --to_markdown, not both.")
-    sys.exit(1)
-elif args.to_markdown is not None:
-    bookmarks.to_markdown(args.to_markdown)
-elif args.pretty_text is not None:
-    if args.pretty_text == "spaces":
-        bookmarks.print_all_titles_spacer("", " ")
-    elif args.pretty_text == "tabs":
-        bookmarks.print_all_titles_spacer("", "\t")
-else:
-    bookmarks.print_all_titles()
+def main() -> None:
+    ''' Entry point for the command-line interface. '''
+
+    # The args object is the end result of processing arguments in Section 1.
+    # An attribute on args is created for each command-line argument:
+    #   to_markdown, pretty_text, and FILE
+    # If an argument is not set, the value is None.
+
+    parser = make_parser()
+    args = parser.parse_args()
+
+    # Errors go through parser.error so they are written to stderr, not into
+    # redirected output.
+
+    if args.pretty_text is not None and args.to_markdown is not None:
+        parser.error("Please choose --pretty_text or --to_markdown, not both.")
+
+    try:
+        # The whole file is needed to decode it, so read it in one go from an
+        # unbuffered file rather than through an 8 KiB read buffer.
+        with open(args.FILE, "rb", buffering=0) as f:
+            data = json_loads(f.readall())
+    except FileNotFoundError:
+        parser.error("The specified file does not exist.")
+    except PermissionError:
+        parser.error("The program does not have permission to read the specified file.")
+
+    if args.to_markdown is not None:
+        bookmarks = build_tree(data, MARKDOWN_FIELDS, consume=True)
+    else:
+        bookmarks = build_tree(data, TEXT_FIELDS, escape_titles=False, consume=True)
+
+    if args.to_markdown is not None:
+        bookmarks.to_markdown(args.to_markdown)
+    elif args.pretty_text is not None:
+        if args.pretty_text == "spaces":
+            bookmarks.print_all_titles_spacer("", " ")
+        elif args.pretty_text == "tabs":
+            bookmarks.print_all_titles_spacer("", "\t")
+    else:
+        bookmarks.print_all_titles()
+
+
+if __name__ == "__main__":
+    main()